@@ -9,27 +9,77 @@ import hmac
 import code
 import sys
 import threading
+import os
 import os.path
 import re
+import heapq
+import bisect
+import socket
+import struct
+import base64
+import time
+import array
 
 class API:
 	"""Wrapper class for BTC-e API methods."""
 
-	def __init__(self, inipath):
-		"""Initialize an API object with a path to the config file and connect to btc-e.com."""
+	def __init__(self, inipath, section = 'API'):
+		"""Initialize an API object with a path to the config file and the name of the account section to read."""
 		self.inipath = inipath
+		self.section = section
+		self.name = API.accountname(section)
 		self.nonce = 0
+		self.locknonce = threading.Lock()
+		self.conn = None
 
 		config = configparser.ConfigParser()
 		config.read(inipath)
-		if not 'API' in config:
-			config.add_section('API')
+		if not section in config:
+			config.add_section(section)
 
-		self.secret = config.get('API', 'secret', fallback='copy API secret here').encode('ascii')
-		self.key = config.get('API', 'key', fallback='copy API secret here').encode('ascii')
+		self.secret = config.get(section, 'secret', fallback='copy API secret here').encode('ascii')
+		self.key = config.get(section, 'key', fallback='copy API secret here').encode('ascii')
+
+	@staticmethod
+	def accountname(section):
+		"""Return the account name of an account section ('API' or 'API:<name>')."""
+		return section.partition(':')[2].strip() or 'Default'
+
+	@staticmethod
+	def sections(inipath):
+		"""Return the names of all account sections in the config file."""
+		config = configparser.ConfigParser()
+		config.read(inipath)
+		sections = [section for section in config.sections() if section == 'API' or section.startswith('API:')]
+		return sections if sections else ['API']
+
+	@staticmethod
+	def accounts(inipath, reserved = ('All',)):
+		"""Return API objects for all account sections with unique names and a list of warnings about skipped sections.
+
+		Names are compared case-insensitively and must not be one of the reserved names."""
+		apis = []
+		warnings = []
+		names = {name.lower() for name in reserved}
+		for section in API.sections(inipath):
+			name = API.accountname(section)
+			if name.lower() in names:
+				warnings.append('Skipping section [{}]: account name {} is reserved or already in use.'.format(section, name))
+				continue
+			names.add(name.lower())
+			apis.append(API(inipath, section))
+		if not apis:
+			apis.append(API(inipath, 'API'))
+		return apis, warnings
 
 	def request(self, method, extraparams = {}):
 		"""Send an API request for method to BTC-e and return a dictionary of the return object."""
+		# nonces are per key, so only requests on the same key have to wait for each other
+		with self.locknonce:
+			return self.request_locked(method, extraparams)
+
+	def request_locked(self, method, extraparams):
+		"""Send an API request while holding the nonce lock."""
 		self.nonce += 1
 		params = {'method' : method, 'nonce' : self.nonce}
 		params.update(extraparams)
@@ -39,13 +89,16 @@ class API:
 		sign = mac.hexdigest()
 
 		response = ''
+		resent = False
 		try:
-			conn = http.client.HTTPSConnection('btc-e.com', timeout=5)
 			headers = {'Content-type' : 'application/x-www-form-urlencoded', 'Key' : self.key, 'Sign' : sign}
-			conn.request('POST', '/tapi', params, headers)
-			response = conn.getresponse().read().decode('utf-8')
+			response, resent = self.post(params, headers)
 		except Exception as err:
-			response = '{{"success" : 0, "error" : "{}"}}'.format(err)
+			if self.conn:
+				self.conn.close()
+			self.conn = None
+			# the request may have reached the server before the connection failed or timed out
+			return {'success' : 0, 'error' : str(err), 'uncertain' : True}
 		j = {}
 		try:
 			j = json.loads(response)
@@ -53,11 +106,44 @@ class API:
 				matchnonce = re.match(r'invalid nonce parameter; on key:(\d+)', j['error'])
 				if matchnonce:
 					self.nonce = int(matchnonce.group(1))
-					return self.request(method, extraparams)
+					# a resent request that hits a used nonce may have been processed before the connection dropped
+					if resent:
+						return {'success' : 0, 'error' : 'Connection dropped, request {} may have been processed already.'.format(method), 'uncertain' : True}
+					return self.request_locked(method, extraparams)
 		except ValueError:
-			j = {'success': 0, 'error': 'No valid JSON document received.'}
+			j = {'success': 0, 'error': 'No valid JSON document received.', 'uncertain' : True}
 		return j
 
+	@staticmethod
+	def uncertain(response):
+		"""Return whether a request may have been processed although it did not report success.
+
+		Only a response with success 0 from the server itself is a definite rejection. Missing responses,
+		connection errors, timeouts and unreadable responses leave the outcome open."""
+		if not response or not 'success' in response:
+			return True
+		return response['success'] != 1 and bool(response.get('uncertain'))
+
+	def post(self, params, headers):
+		"""POST to the trade API on the kept-alive connection of this key and return (response, resent).
+
+		A reused connection the server closed while idle fails on its next request, which is then sent
+		once more on a fresh connection."""
+		reused = self.conn is not None
+		if not reused:
+			self.conn = http.client.HTTPSConnection('btc-e.com', timeout=5)
+		try:
+			self.conn.request('POST', '/tapi', params, headers)
+			return self.conn.getresponse().read().decode('utf-8'), False
+		except (ConnectionError, http.client.BadStatusLine, http.client.CannotSendRequest):
+			self.conn.close()
+			self.conn = None
+			if not reused:
+				raise
+		self.conn = http.client.HTTPSConnection('btc-e.com', timeout=5)
+		self.conn.request('POST', '/tapi', params, headers)
+		return self.conn.getresponse().read().decode('utf-8'), True
+
 	def getinfo(self):
 		"""Request account balance info."""
 		return self.request('getInfo')
@@ -115,4 +201,705 @@ class API:
 	@staticmethod
 	def trades(pair):
 		"""Query public trades method for given currency pair."""
-		return API.query('trades', pair)
\ No newline at end of file
+		return API.query('trades', pair)
+
+class Valuation:
+	"""Values funds in a base currency through a conversion graph built from the available currency pairs."""
+
+	def __init__(self, base = 'usd', maxhops = 3):
+		"""Initialize with the base currency and the maximum number of conversions of cached paths."""
+		self.base = base
+		self.maxhops = maxhops
+		self.pairs = frozenset()
+		self.paths = {}
+		self.tickerpairs = []
+
+	def update(self, pairs, base = None):
+		"""Rebuild the cached conversion paths if the pair list or the base currency changed."""
+		pairs = frozenset(pairs)
+		base = base if base else self.base
+		if pairs == self.pairs and base == self.base:
+			return
+		self.pairs = pairs
+		self.build(base)
+
+	def build(self, base):
+		"""Precompute all conversion paths of up to maxhops steps from every currency to the base currency.
+
+		A path is a list of (pair, sell) steps. sell is True if the currency held before the step is the
+		first currency of the pair and is sold at the pair's bid, otherwise the second currency of the pair
+		is spent at its ask. Which path is best depends on the tickers, so all of them are kept."""
+		edges = {}
+		for pair in self.pairs:
+			currs = pair.split('_')
+			if len(currs) != 2:
+				continue
+			edges.setdefault(currs[0], []).append((currs[1], pair, True))
+			edges.setdefault(currs[1], []).append((currs[0], pair, False))
+
+		# extend paths backwards from the base currency, visiting every currency at most once per path
+		paths = {base : [[]]}
+		stack = [(base, [], {base})]
+		while stack:
+			curr, path, visited = stack.pop()
+			if len(path) >= self.maxhops:
+				continue
+			for other, pair, sell in edges.get(curr, []):
+				if other in visited:
+					continue
+				# the edge is stored from curr's side, so the step from other to curr trades the other way
+				otherpath = [(pair, not sell)] + path
+				paths.setdefault(other, []).append(otherpath)
+				stack.append((other, otherpath, visited | {other}))
+
+		self.tickerpairs = sorted({pair for currpaths in paths.values() for path in currpaths for pair, sell in path})
+		# publish paths before the base currency, readers check the base first
+		self.paths = paths
+		self.base = base
+
+	def fetch(self, extrapairs = ()):
+		"""Query the tickers of all pairs on cached paths and of extrapairs with a single request."""
+		pairs = sorted(set(self.tickerpairs).union(extrapairs))
+		if not pairs:
+			return {}
+		return API.ticker('-'.join(pairs))
+
+	def rate(self, curr, tickers, paths = None):
+		"""Return the best rate of curr in the base currency over all cached paths or None if no path is priced."""
+		paths = paths if paths is not None else self.paths
+		best = None
+		for path in paths.get(curr, []):
+			rate = 1.0
+			for pair, sell in path:
+				ticker = tickers.get(pair)
+				price = float(ticker['sell'] if sell else ticker['buy']) if ticker else 0.0
+				if price <= 0.0:
+					rate = None
+					break
+				rate = rate * price if sell else rate / price
+			if rate is not None and (best is None or rate > best):
+				best = rate
+		return best
+
+	def rates(self, tickers):
+		"""Return the best rate of every currency with cached paths (None if no path is priced) for one set of tickers."""
+		paths = self.paths
+		return {curr : self.rate(curr, tickers, paths) for curr in paths}
+
+	@staticmethod
+	def value(funds, rates):
+		"""Return the value of every fund in the base currency (None if unknown), the total value and whether the
+		total is complete, i.e. no nonzero balance lacks a rate."""
+		values = {}
+		total = 0.0
+		complete = True
+		for curr, balance in funds.items():
+			rate = rates.get(curr)
+			values[curr] = float(balance) * rate if rate is not None else None
+			if values[curr] is not None:
+				total += values[curr]
+			elif float(balance) != 0.0:
+				complete = False
+		return values, total, complete
+
+class Triggers:
+	"""Price alerts, stop-loss and take-profit rules indexed by threshold in per pair heaps."""
+	kinds = ['Alert above', 'Alert below', 'Stop-loss', 'Take-profit']
+	retries = 3
+	backoff = 5.0
+
+	def __init__(self, path):
+		"""Initialize with the path of the JSON file the rules persist in and load them."""
+		self.path = path
+		self.lock = threading.Lock()
+		self.rules = {}
+		self.heaps = {}
+		self.nextid = 1
+		self.version = 0
+		self.loaderror = ''
+		self.load()
+
+	@staticmethod
+	def index(rule):
+		"""Return the heap key (pair, side, above) of a rule.
+
+		Sell rules watch the best bid and buy rules the best ask. Rules with above set fire once the price
+		rises to the threshold, the others once it falls to it."""
+		side = 'bid' if rule['type'] == 'sell' else 'ask'
+		if rule['kind'] == 'Alert above':
+			above = True
+		elif rule['kind'] == 'Alert below':
+			above = False
+		elif rule['kind'] == 'Stop-loss':
+			above = rule['type'] == 'buy'
+		else:
+			above = rule['type'] == 'sell'
+		return (rule['pair'], side, above)
+
+	def push(self, rule):
+		"""Index a rule. Above heaps are min-heaps of thresholds, below heaps hold negated thresholds."""
+		key = Triggers.index(rule)
+		threshold = rule['threshold'] if key[2] else -rule['threshold']
+		heapq.heappush(self.heaps.setdefault(key, []), (threshold, rule['id']))
+
+	def add(self, pair, kind, type, threshold, amount = 0.0, rate = 0.0, account = ''):
+		"""Add a rule and return it. A rate of 0 places fired orders at the triggering price."""
+		with self.lock:
+			rule = {'id' : self.nextid, 'pair' : pair, 'kind' : kind, 'type' : type, 'threshold' : float(threshold), 'amount' : float(amount), 'rate' : float(rate), 'account' : account}
+			self.nextid += 1
+			self.rules[rule['id']] = rule
+			self.push(rule)
+			self.save()
+			return rule
+
+	def remove(self, id):
+		"""Remove a rule. Its heap entry is dropped lazily once it reaches the top."""
+		with self.lock:
+			if self.rules.pop(id, None):
+				self.save()
+
+	def rearm(self, rule, now = None):
+		"""Put a fired rule back after its order was rejected so it fires again once its backoff ran out.
+
+		The backoff doubles with every failure. Return False and leave the rule removed once it failed
+		more than retries times."""
+		failures = rule.get('failures', 0) + 1
+		if failures > Triggers.retries:
+			return False
+		now = now if now is not None else time.time()
+		with self.lock:
+			rule = {key : rule[key] for key in rule if key != 'price'}
+			rule['failures'] = failures
+			rule['retryafter'] = now + Triggers.backoff * 2 ** (failures - 1)
+			self.rules[rule['id']] = rule
+			self.push(rule)
+			self.save()
+		return True
+
+	def pairs(self):
+		"""Return all pairs with rules."""
+		with self.lock:
+			return {rule['pair'] for rule in self.rules.values()}
+
+	def list(self):
+		"""Return a copy of all rules sorted by id."""
+		with self.lock:
+			return [dict(self.rules[id]) for id in sorted(self.rules)]
+
+	def evaluate(self, pair, bid, ask, now = None):
+		"""Fire and remove all rules of pair reached by bid/ask and return copies with the triggering price.
+		Rules still backing off after a rejected order stay armed."""
+		now = now if now is not None else time.time()
+		fired = []
+		with self.lock:
+			for side, price in (('bid', bid), ('ask', ask)):
+				if not price:
+					continue
+				price = float(price)
+				for above in (True, False):
+					heap = self.heaps.get((pair, side, above))
+					limit = price if above else -price
+					deferred = []
+					# only rules at the top of the heap can fire
+					while heap and heap[0][0] <= limit:
+						entry = heapq.heappop(heap)
+						rule = self.rules.get(entry[1])
+						if not rule:
+							continue
+						if rule.get('retryafter', 0.0) > now:
+							deferred.append(entry)
+							continue
+						del self.rules[entry[1]]
+						fired.append(dict(rule, price=price))
+					for entry in deferred:
+						heapq.heappush(heap, entry)
+			if fired:
+				self.save()
+		return fired
+
+	def load(self):
+		"""Load rules from the JSON file. An unreadable file is moved aside to <path>.bad and reported in loaderror."""
+		if not os.path.isfile(self.path):
+			return
+		try:
+			with open(self.path) as file:
+				state = json.load(file)
+			rules = state['rules']
+			self.nextid = int(state['nextid'])
+			for rule in rules:
+				Triggers.index(rule)
+				float(rule['threshold'])
+				self.nextid = max(self.nextid, int(rule['id']) + 1)
+		except (OSError, ValueError, KeyError, TypeError) as err:
+			os.replace(self.path, self.path + '.bad')
+			self.loaderror = 'Could not load rules from {} ({}), moved it to {}.bad.'.format(self.path, err, self.path)
+			self.nextid = 1
+			return
+		for rule in rules:
+			self.rules[rule['id']] = rule
+			self.push(rule)
+
+	def save(self):
+		"""Save rules to the JSON file while holding the lock. The file is replaced atomically."""
+		self.version += 1
+		with open(self.path + '.tmp', 'w') as file:
+			json.dump({'nextid' : self.nextid, 'rules' : [self.rules[id] for id in sorted(self.rules)]}, file, indent=1)
+		os.replace(self.path + '.tmp', self.path)
+
+class Book:
+	"""Local order book of one currency pair that depth diffs are applied to in place."""
+
+	def __init__(self):
+		self.seq = None
+		self.levels = {'asks' : {}, 'bids' : {}}
+		# sorted keys, bids are negated so that both sides sort best first
+		self.keys = {'asks' : [], 'bids' : []}
+
+	def reset(self, asks, bids, seq):
+		"""Replace the book with a snapshot at sequence number seq."""
+		self.seq = seq
+		self.levels = {'asks' : {}, 'bids' : {}}
+		self.keys = {'asks' : [], 'bids' : []}
+		self.apply('asks', asks)
+		self.apply('bids', bids)
+
+	def apply(self, side, levels):
+		"""Apply [rate, amount] levels to side ('asks' or 'bids'). An amount of 0 removes the level."""
+		book = self.levels[side]
+		keys = self.keys[side]
+		sign = 1.0 if side == 'asks' else -1.0
+		for rate, amount in levels:
+			rate = float(rate)
+			amount = float(amount)
+			if amount <= 0.0:
+				if book.pop(rate, None) is not None:
+					del keys[bisect.bisect_left(keys, sign * rate)]
+			else:
+				if not rate in book:
+					bisect.insort(keys, sign * rate)
+				book[rate] = amount
+
+	def depth(self, limit = 150):
+		"""Return the best limit levels in the format of the public depth method."""
+		depth = {}
+		for side, sign in (('asks', 1.0), ('bids', -1.0)):
+			book = self.levels[side]
+			depth[side] = [[sign * key, book[sign * key]] for key in self.keys[side][:limit]]
+		return depth
+
+class WebSocket:
+	"""Minimal RFC 6455 text message connection used by the streaming feed and its stand-in server."""
+	guid = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+	def __init__(self, sock, mask):
+		"""Wrap a connected socket. Clients mask the frames they send, servers do not."""
+		self.sock = sock
+		self.mask = mask
+		self.buffer = b''
+		self.fragments = []
+		self.locksend = threading.Lock()
+
+	@staticmethod
+	def acceptkey(key):
+		return base64.b64encode(hashlib.sha1((key + WebSocket.guid).encode('ascii')).digest()).decode('ascii')
+
+	@staticmethod
+	def connect(url, timeout = 5):
+		"""Open a client connection to a ws:// url."""
+		url = urllib.parse.urlparse(url)
+		sock = socket.create_connection((url.hostname, url.port or 80), timeout=timeout)
+		key = base64.b64encode(os.urandom(16)).decode('ascii')
+		request = 'GET {} HTTP/1.1\r\nHost: {}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: {}\r\nSec-WebSocket-Version: 13\r\n\r\n'
+		sock.sendall(request.format(url.path or '/', url.netloc, key).encode('ascii'))
+		ws = WebSocket(sock, True)
+		headers = ws.readheaders()
+		status = headers.split('\r\n', 1)[0]
+		if not status.startswith('HTTP/1.1 101') or not WebSocket.acceptkey(key) in headers:
+			sock.close()
+			raise ConnectionError('WebSocket handshake failed: {}'.format(status))
+		return ws
+
+	@staticmethod
+	def accept(sock):
+		"""Answer the handshake of a client connection accepted by a server."""
+		ws = WebSocket(sock, False)
+		headers = ws.readheaders()
+		match = re.search(r'Sec-WebSocket-Key:\s*(\S+)', headers, re.IGNORECASE)
+		if not match:
+			sock.close()
+			raise ConnectionError('No WebSocket handshake received.')
+		response = 'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Accept: {}\r\n\r\n'
+		sock.sendall(response.format(WebSocket.acceptkey(match.group(1))).encode('ascii'))
+		return ws
+
+	def readheaders(self):
+		"""Read an HTTP header block, leaving any following data in the buffer."""
+		while not b'\r\n\r\n' in self.buffer:
+			data = self.sock.recv(4096)
+			if not data:
+				raise ConnectionError('Connection closed during handshake.')
+			self.buffer += data
+		headers, self.buffer = self.buffer.split(b'\r\n\r\n', 1)
+		return headers.decode('latin-1')
+
+	def send(self, text, opcode = 0x1):
+		"""Send a text message (or a control frame of the given opcode)."""
+		payload = text.encode('utf-8')
+		length = len(payload)
+		if length < 126:
+			header = struct.pack('!BB', 0x80 | opcode, length | (0x80 if self.mask else 0))
+		elif length < 65536:
+			header = struct.pack('!BBH', 0x80 | opcode, 126 | (0x80 if self.mask else 0), length)
+		else:
+			header = struct.pack('!BBQ', 0x80 | opcode, 127 | (0x80 if self.mask else 0), length)
+		if self.mask:
+			key = os.urandom(4)
+			header += key
+			payload = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+		with self.locksend:
+			self.sock.sendall(header + payload)
+
+	def parse(self):
+		"""Remove and return one complete (fin, opcode, payload) frame from the buffer or None."""
+		buffer = self.buffer
+		if len(buffer) < 2:
+			return None
+		fin = buffer[0] & 0x80
+		opcode = buffer[0] & 0x0f
+		masked = buffer[1] & 0x80
+		length = buffer[1] & 0x7f
+		offset = 2
+		if length == 126:
+			if len(buffer) < 4:
+				return None
+			length = struct.unpack('!H', buffer[2:4])[0]
+			offset = 4
+		elif length == 127:
+			if len(buffer) < 10:
+				return None
+			length = struct.unpack('!Q', buffer[2:10])[0]
+			offset = 10
+		key = b''
+		if masked:
+			key = buffer[offset:offset + 4]
+			offset += 4
+		if len(buffer) < offset + length:
+			return None
+		payload = buffer[offset:offset + length]
+		if masked:
+			payload = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+		self.buffer = buffer[offset + length:]
+		return fin, opcode, payload
+
+	def recv(self):
+		"""Return the next text message. Raises socket.timeout if none arrives within the socket timeout."""
+		while True:
+			frame = self.parse()
+			if not frame:
+				# a timeout here leaves partial frames buffered for the next call
+				data = self.sock.recv(65536)
+				if not data:
+					raise ConnectionError('Connection closed.')
+				self.buffer += data
+				continue
+			fin, opcode, payload = frame
+			if opcode == 0x8:
+				raise ConnectionError('Connection closed by peer.')
+			elif opcode == 0x9:
+				self.send(payload.decode('utf-8'), 0xA)
+			elif opcode in (0x0, 0x1):
+				self.fragments.append(payload)
+				if fin:
+					text = b''.join(self.fragments).decode('utf-8')
+					self.fragments = []
+					return text
+
+	def close(self):
+		try:
+			self.send('', 0x8)
+		except OSError:
+			pass
+		self.sock.close()
+
+class Feed:
+	"""Market data feed for one subscribed currency pair running on its own thread.
+
+	Subclasses define step, which the feed thread calls until the feed is stopped."""
+
+	def __init__(self):
+		self.pair = ''
+		self.run = False
+		self.thread = None
+		self.ondepth = None
+		self.ontrades = None
+		self.onerror = None
+
+	@staticmethod
+	def fromconfig(inipath):
+		"""Create the feed configured in the [Feed] section of the config file (polling by default)."""
+		config = configparser.ConfigParser()
+		config.read(inipath)
+		if config.get('Feed', 'type', fallback='poll') == 'stream':
+			return StreamFeed(config.get('Feed', 'url', fallback='ws://localhost:8765/'))
+		return PollingFeed(config.getfloat('Feed', 'interval', fallback=1.0))
+
+	def listen(self, ondepth, ontrades = None, onerror = None):
+		"""Set callbacks ondepth(pair, depth), ontrades(pair, trades) and onerror(text), called on the feed thread.
+
+		depth is in the format of the public depth method for a single pair or None if unavailable."""
+		self.ondepth = ondepth
+		self.ontrades = ontrades
+		self.onerror = onerror
+
+	def subscribe(self, pair):
+		"""Switch the feed to pair (e.g. 'btc_usd'). An empty pair pauses the feed."""
+		self.pair = pair
+
+	def start(self):
+		self.run = True
+		self.thread = threading.Thread(target=self.loop)
+		self.thread.start()
+
+	def stop(self):
+		self.run = False
+
+	def loop(self):
+		"""Call step until the feed is stopped. A failing step is reported and retried after a second."""
+		while self.run:
+			try:
+				self.step()
+			except Exception as err:
+				self.error('Feed error on {}: {!r}'.format(self.pair, err))
+				time.sleep(1.0)
+
+	def publishdepth(self, pair, depth):
+		self.callback(self.ondepth, pair, depth)
+
+	def publishtrades(self, pair, trades):
+		self.callback(self.ontrades, pair, trades)
+
+	def callback(self, function, *args):
+		"""Call a listener without letting its exceptions end the feed thread."""
+		if not function:
+			return
+		try:
+			function(*args)
+		except Exception as err:
+			self.error('Error in feed callback: {!r}'.format(err))
+
+	def error(self, text):
+		if self.onerror:
+			self.onerror(text)
+
+class PollingFeed(Feed):
+	"""Feed that polls the public depth method of the subscribed pair."""
+
+	def __init__(self, interval = 1.0):
+		Feed.__init__(self)
+		self.interval = interval
+
+	def step(self):
+		"""Poll the subscribed pair once and wait for the interval."""
+		pair = self.pair
+		if pair:
+			try:
+				self.poll(pair)
+			except Exception as err:
+				self.error('Error polling depth of {}: {!r}'.format(pair, err))
+		time.sleep(self.interval)
+
+	def poll(self, pair):
+		depth = API.depth(pair)
+		if depth and 'success' in depth.keys():
+			if depth['success'] == 1:
+				depth = depth['return']
+			else:
+				self.error('Error requesting depth: {}'.format(depth['error']))
+				depth = None
+		self.publishdepth(pair, depth.get(pair) if depth else None)
+
+class StreamFeed(Feed):
+	"""Feed that applies depth diffs pushed over a WebSocket stream to a local book.
+
+	Every message of a pair carries a sequence number. A gap in the sequence or a malformed message
+	discards the book and requests a new snapshot, later diffs are dropped until it arrives. A snapshot
+	that does not arrive within timeout seconds or maxdropped diffs is requested again."""
+
+	def __init__(self, url, limit = 150, timeout = 5.0, maxdropped = 50):
+		Feed.__init__(self)
+		self.url = url
+		self.limit = limit
+		self.timeout = timeout
+		self.maxdropped = maxdropped
+		# time the pending snapshot was requested and diffs dropped since
+		self.requested = 0.0
+		self.dropped = 0
+
+	def step(self):
+		"""Connect and stream until the connection fails, the feed loop then reports it and reconnects."""
+		ws = WebSocket.connect(self.url)
+		try:
+			ws.sock.settimeout(0.5)
+			self.stream(ws)
+		finally:
+			ws.close()
+
+	def stream(self, ws):
+		subscribed = ''
+		book = Book()
+		while self.run:
+			pair = self.pair
+			if pair != subscribed:
+				if subscribed:
+					ws.send(json.dumps({'op' : 'unsubscribe', 'pair' : subscribed}))
+				if pair:
+					ws.send(json.dumps({'op' : 'subscribe', 'pair' : pair}))
+				subscribed = pair
+				book = Book()
+				# the subscription answers with a snapshot
+				self.requested = time.monotonic()
+				self.dropped = 0
+			try:
+				text = ws.recv()
+			except socket.timeout:
+				if subscribed and book.seq is None:
+					self.checksnapshot(ws, subscribed, book)
+				continue
+			# connection errors end the stream and reconnect, anything else only resyncs the book
+			try:
+				self.handle(ws, subscribed, book, json.loads(text))
+			except OSError:
+				raise
+			except Exception as err:
+				self.error('Malformed message on {} ({!r}), resyncing.'.format(subscribed, err))
+				self.resync(ws, subscribed, book)
+
+	def resync(self, ws, pair, book):
+		"""Drop the book and request a snapshot."""
+		book.seq = None
+		self.requested = time.monotonic()
+		self.dropped = 0
+		if pair:
+			ws.send(json.dumps({'op' : 'snapshot', 'pair' : pair}))
+
+	def checksnapshot(self, ws, pair, book):
+		"""Request the pending snapshot again if it is overdue, e.g. because the server dropped it."""
+		if self.dropped >= self.maxdropped or time.monotonic() - self.requested >= self.timeout:
+			self.error('No snapshot of {} after {} diffs, requesting it again.'.format(pair, self.dropped))
+			self.resync(ws, pair, book)
+
+	def handle(self, ws, pair, book, message):
+		"""Apply a message of the stream to the book of the subscribed pair."""
+		if message.get('pair') != pair:
+			return
+		if message['type'] == 'error':
+			self.error('Stream error on {}: {}'.format(pair, message['error']))
+			return
+
+		if message['type'] == 'snapshot':
+			book.reset(message['asks'], message['bids'], message['seq'])
+			self.publishdepth(pair, book.depth(self.limit))
+			return
+		if book.seq is None:
+			self.dropped += 1
+			self.checksnapshot(ws, pair, book)
+			return
+		if message['seq'] <= book.seq:
+			return
+		if message['seq'] != book.seq + 1:
+			self.error('Sequence gap on {} ({} after {}), resyncing.'.format(pair, message['seq'], book.seq))
+			self.resync(ws, pair, book)
+			return
+		book.seq = message['seq']
+		if message['type'] == 'depth':
+			book.apply('asks', message.get('asks', []))
+			book.apply('bids', message.get('bids', []))
+			self.publishdepth(pair, book.depth(self.limit))
+		elif message['type'] == 'trades':
+			self.publishtrades(pair, message['trades'])
+
+class History:
+	"""Rolling history of spread, mid-price and top of book imbalance of one currency pair.
+
+	Samples live in ring buffers preallocated for capacity samples, so memory stays fixed. Time is divided
+	into buckets of resolution seconds and a sample in the same bucket as the previous one replaces it
+	instead of being appended."""
+	metrics = ['spread', 'mid', 'imbalance']
+
+	def __init__(self, capacity = 14400, resolution = 1.0):
+		self.capacity = capacity
+		self.resolution = resolution
+		self.count = 0
+		self.head = 0
+		self.total = 0
+		self.times = array.array('d', bytes(8 * capacity))
+		self.values = {metric : array.array('d', bytes(8 * capacity)) for metric in History.metrics}
+		self.lock = threading.Lock()
+
+	def record(self, depth, now = None):
+		"""Derive the metrics of a depth table and append them. Returns False if a side of the book is empty."""
+		if not depth.get('asks') or not depth.get('bids'):
+			return False
+		ask, askamount = (float(value) for value in depth['asks'][0][:2])
+		bid, bidamount = (float(value) for value in depth['bids'][0][:2])
+		volume = askamount + bidamount
+		self.append(now if now is not None else time.time(), {'spread' : ask - bid, 'mid' : (ask + bid) / 2.0, 'imbalance' : (bidamount - askamount) / volume if volume > 0.0 else 0.0})
+		return True
+
+	def append(self, now, values):
+		"""Append a sample of all metrics in O(1)."""
+		with self.lock:
+			last = (self.head - 1) % self.capacity
+			if self.count and int(now / self.resolution) == int(self.times[last] / self.resolution):
+				index = last
+			else:
+				index = self.head
+				self.head = (self.head + 1) % self.capacity
+				self.count = min(self.count + 1, self.capacity)
+			self.times[index] = now
+			for metric in History.metrics:
+				self.values[metric][index] = values[metric]
+			self.total += 1
+
+	def last(self, metric):
+		"""Return the latest value of metric or None without samples."""
+		with self.lock:
+			return self.values[metric][(self.head - 1) % self.capacity] if self.count else None
+
+	def window(self, metric, seconds, now = None):
+		"""Return (times, values) of metric for the last seconds, oldest first."""
+		now = now if now is not None else time.time()
+		with self.lock:
+			start = self.head - self.count
+			times = self.times
+			# binary search for the oldest sample inside the window, times are ascending in ring order
+			low = 0
+			high = self.count
+			while low < high:
+				mid = (low + high) // 2
+				if times[(start + mid) % self.capacity] < now - seconds:
+					low = mid + 1
+				else:
+					high = mid
+			indices = [(start + i) % self.capacity for i in range(low, self.count)]
+			values = self.values[metric]
+			return [times[i] for i in indices], [values[i] for i in indices]
+
+	def stats(self, metric, seconds, now = None):
+		"""Return (min, max, mean) of metric for the last seconds or None without samples."""
+		times, values = self.window(metric, seconds, now)
+		if not values:
+			return None
+		return min(values), max(values), sum(values) / len(values)
+
+	def downsample(self, metric, points, seconds, now = None):
+		"""Return the means of metric in points equal time buckets over the last seconds (None for empty buckets)."""
+		now = now if now is not None else time.time()
+		times, values = self.window(metric, seconds, now)
+		sums = [0.0] * points
+		counts = [0] * points
+		for t, value in zip(times, values):
+			bucket = min(points - 1, int((t - now + seconds) * points / seconds))
+			sums[bucket] += value
+			counts[bucket] += 1
+		return [sums[i] / counts[i] if counts[i] else None for i in range(points)]
@@ -0,0 +1,192 @@
+#! python3
+import tkinter
+import argparse
+import random
+import time
+import json
+import statistics
+import tracemalloc
+import platform
+import sys
+import BTCeGUI
+
+class TkCounter:
+	"""Proxy for a Tcl interpreter that counts the Tcl commands run through call and eval."""
+	counted = ('call', 'eval')
+
+	def __init__(self, tk):
+		self.tk = tk
+		self.calls = 0
+
+	def __getattr__(self, name):
+		attr = getattr(self.tk, name)
+		if not name in TkCounter.counted:
+			return attr
+		def counted(*args, **kwargs):
+			self.calls += 1
+			return attr(*args, **kwargs)
+		return counted
+
+def instrument(widget, tk):
+	"""Route all Tcl calls of widget, its children and their variables through tk (a counter or the raw interpreter)."""
+	widget.tk = tk
+	for value in vars(widget).values():
+		values = value if isinstance(value, list) else [value]
+		for var in values:
+			if isinstance(var, tkinter.Variable):
+				var._tk = tk
+	for child in widget.children.values():
+		instrument(child, tk)
+
+def make_depth(levels, rng):
+	"""Synthetic depth table with levels asks and bids around a rate of 100."""
+	asks = [[round(100.0 + 0.01 * (i + 1), 3), round(rng.uniform(0.01, 50.0), 8)] for i in range(levels)]
+	bids = [[round(100.0 - 0.01 * (i + 1), 3), round(rng.uniform(0.01, 50.0), 8)] for i in range(levels)]
+	return {'asks' : asks, 'bids' : bids}
+
+def make_orders(count, rng, account='Default'):
+	"""Synthetic active orders."""
+	orders = {}
+	for i in range(count):
+		orders[str(100000 + i)] = {'pair' : 'btc_usd', 'type' : rng.choice(['buy', 'sell']), 'amount' : round(rng.uniform(0.01, 10.0), 8), 'rate' : round(rng.uniform(90.0, 110.0), 3), 'timestamp_created' : 1400000000 + i, 'status' : 0, 'account' : account}
+	return orders
+
+def make_funds(count, rng):
+	"""Synthetic funds for count currencies, including the currencies of the benchmark pair."""
+	funds = {'btc' : round(rng.uniform(0.0, 100.0), 8), 'usd' : round(rng.uniform(0.0, 10000.0), 8)}
+	for i in range(max(0, count - len(funds))):
+		funds['c{:04d}'.format(i)] = round(rng.uniform(0.0, 1000.0), 8)
+	return funds
+
+class Bench:
+	"""Times update and redraw cycles of the BTCeGUI frames against a hidden main window."""
+	def __init__(self, repeat):
+		self.repeat = repeat
+		self.root = BTCeGUI.Main()
+		self.root.withdraw()
+		self.tk = self.root.tk
+		self.counter = TkCounter(self.tk)
+		self.results = []
+
+	def close(self):
+		self.root.exit()
+		self.root.destroy()
+
+	def measure(self, name, size, update):
+		"""Time update and the following redraw, count Tk calls and trace memory of one cycle."""
+		# warm up caches and reach steady state table contents
+		update()
+		self.root.update_idletasks()
+
+		updatetimes = []
+		redrawtimes = []
+		for i in range(self.repeat):
+			start = time.perf_counter()
+			update()
+			mid = time.perf_counter()
+			self.root.update_idletasks()
+			end = time.perf_counter()
+			updatetimes.append(mid - start)
+			redrawtimes.append(end - mid)
+
+		# count on a separate pass so the proxy does not distort the timings
+		instrument(self.root, self.counter)
+		self.counter.calls = 0
+		update()
+		tkcalls = self.counter.calls
+		instrument(self.root, self.tk)
+		self.root.update_idletasks()
+
+		tracemalloc.start()
+		update()
+		self.root.update_idletasks()
+		current, peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+
+		result = {
+			'case' : name,
+			'size' : size,
+			'repeat' : self.repeat,
+			'update_min' : min(updatetimes),
+			'update_median' : statistics.median(updatetimes),
+			'update_mean' : statistics.mean(updatetimes),
+			'redraw_min' : min(redrawtimes),
+			'redraw_median' : statistics.median(redrawtimes),
+			'redraw_mean' : statistics.mean(redrawtimes),
+			'tk_calls' : tkcalls,
+			'memory_peak' : peak,
+			'memory_retained' : current,
+		}
+		self.results.append(result)
+		print('{case:<20} {size:>6} update {update_median:10.6f}s redraw {redraw_median:10.6f}s tk calls {tk_calls:>8} peak {memory_peak:>10}B'.format(**result))
+		# drop timers scheduled by Main.sync since there is no main loop running them
+		for id in self.root.tk.splitlist(self.root.tk.call('after', 'info')):
+			self.root.after_cancel(id)
+
+	def run(self, sizes, seed):
+		root = self.root
+		pair = ['BTC', 'USD']
+		for size in sizes:
+			rng = random.Random(seed)
+			# alternate between two books so that every cycle changes the tables
+			depths = [make_depth(size, rng), make_depth(size, rng)]
+			orders = [make_orders(size, rng), make_orders(size, rng)]
+			funds = [make_funds(size, rng), make_funds(size, rng)]
+			state = {'i' : 0}
+			def pick(data):
+				state['i'] += 1
+				return data[state['i'] % 2]
+
+			self.measure('DepthFrame.update', size, lambda: root.askframe.update(pick(depths), pair))
+			self.measure('OrderFrame.update', size, lambda: root.orderframe.update(pick(orders), True, False))
+			values = [{curr : 2.0 * balance for curr, balance in fund.items()} for fund in funds]
+			def update_balance():
+				fund = pick(funds)
+				value = values[state['i'] % 2]
+				root.balanceframe.update(fund, value, sum(value.values()), 'usd')
+			self.measure('BalanceFrame.update', size, update_balance)
+
+			root.buybox.update(pair, funds[0], 0.2, True, False)
+			root.buybox.allchecked.set(1)
+			def update_amounts():
+				root.buybox.funds = pick(funds)
+				root.buybox.update_amounts()
+			self.measure('TradeFrame.update_amounts', size, update_amounts)
+			root.buybox.allchecked.set(0)
+
+			root.currencybox.set('BTC/USD')
+			root.accountbox.set(root.accountbox.cget('values')[-1])
+			name = next(iter(root.apis))
+			root.info = {'pairs' : {'btc_usd' : {'fee' : 0.2, 'decimal_places' : 3, 'min_price' : 0.1, 'max_price' : 10000, 'min_amount' : 0.01, 'hidden' : 0}}}
+			def sync():
+				root.depth = {'btc_usd' : pick(depths)}
+				root.userinfo = {name : {'funds' : funds[state['i'] % 2], 'rights' : {'info' : 1, 'trade' : 1, 'withdraw' : 0}}}
+				root.orders = {name : orders[state['i'] % 2]}
+				root.sync()
+			self.measure('Main.sync', size, sync)
+		return self.results
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark BTCeGUI frame updates against a hidden Tk root.')
+	parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 5000], help='depth levels, orders and currencies per case')
+	parser.add_argument('--repeat', type=int, default=10, help='timed cycles per case')
+	parser.add_argument('--seed', type=int, default=0, help='seed for synthetic data')
+	parser.add_argument('--output', default='BTCeBench.json', help='path of the JSON results file')
+	args = parser.parse_args()
+
+	try:
+		bench = Bench(args.repeat)
+	except tkinter.TclError as err:
+		print('Cannot create the Tk window ({}). The benchmark needs a display, e.g. run it with xvfb-run.'.format(err), file=sys.stderr)
+		sys.exit(1)
+	try:
+		results = bench.run(args.sizes, args.seed)
+	finally:
+		bench.close()
+
+	with open(args.output, 'w') as file:
+		json.dump({'python' : platform.python_version(), 'tk' : tkinter.TkVersion, 'time' : time.time(), 'results' : results}, file, indent=1)
+	print('Results written to {}.'.format(args.output))
+
+if __name__ == '__main__':
+	main()
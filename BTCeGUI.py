@@ -10,7 +10,7 @@ import datetime
 import queue
 import BTCe
 
-api = BTCe.API('BTCe.ini')
+apis, accountwarnings = BTCe.API.accounts('BTCe.ini')
 console = None
 
 def format_float(value):
@@ -39,6 +39,16 @@ class CurrencyBox(ttk.Combobox):
 		values.sort()
 		self.config(values=values)
 
+class AccountBox(ttk.Combobox):
+	"""Account selection combo box."""
+	def __init__(self, parent, names):
+		ttk.Combobox.__init__(self, parent, state='readonly', justify='left', width=12)
+		values = list(names)
+		if len(values) > 1:
+			values.append('All')
+		self.config(values=values)
+		self.set(values[-1])
+
 class TradeFrame(ttk.Frame):
 	"""Buy/sell box."""
 	def __init__(self, parent, type):
@@ -216,7 +226,7 @@ class OrderFrame(ttk.Frame):
 		ttk.Frame.__init__(self, parent, borderwidth=10, relief='groove')
 
 		# init widgets
-		self.table = ttk.Treeview(self, columns=['id', 'time', 'pair', 'type', 'rate', 'amount', 'value', 'status'], show='headings', height=3)
+		self.table = ttk.Treeview(self, columns=['id', 'account', 'time', 'pair', 'type', 'rate', 'amount', 'value', 'status'], show='headings', height=3)
 		vsb = ttk.Scrollbar(self, orient='vertical', command=self.table.yview)
 		self.table.config(yscrollcommand=vsb.set)
 		self.orderbutton = ttk.Button(self, text='Cancel Order(s)', state='disabled', command=self.cancelorders)
@@ -233,6 +243,7 @@ class OrderFrame(ttk.Frame):
 
 		# table layout
 		self.table.heading('id', text='ID', anchor='w')
+		self.table.heading('account', text='Account', anchor='w')
 		self.table.heading('time', text='Placed on', anchor='w')
 		self.table.heading('pair', text='Pair', anchor='w')
 		self.table.heading('type', text='Type', anchor='w')
@@ -242,6 +253,7 @@ class OrderFrame(ttk.Frame):
 		self.table.heading('status', text='Status', anchor='w')
 
 		self.table.column('id', width=15)
+		self.table.column('account', width=30)
 		self.table.column('time', width=60)
 		self.table.column('pair', width=10)
 		self.table.column('type', width=20)
@@ -256,7 +268,8 @@ class OrderFrame(ttk.Frame):
 		selects = self.table.selection()
 		selectids = []
 		for select in selects:
-			selectids.append(int(self.table.item(select)['values'][0]))
+			values = self.table.item(select)['values']
+			selectids.append((str(values[1]), int(values[0])))
 		threading.Thread(target=self.master.cancelorders, args=[selectids]).start()
 
 	def update(self, orders, cantrade, cancelling):
@@ -291,7 +304,7 @@ class OrderFrame(ttk.Frame):
 			amount = format_float(amount) + ' ' + pair[0]
 			status = OrderFrame.status[order['status']]
 
-			values = [id, time, '/'.join(pair), order['type'].capitalize(), rate, amount, value, status]
+			values = [id, order['account'], time, '/'.join(pair), order['type'].capitalize(), rate, amount, value, status]
 			item = self.table.insert('', 'end', values=values)
 			if int(id) in selectids:
 				self.table.selection_add(item)
@@ -351,53 +364,221 @@ class DepthFrame(ttk.Frame):
 				self.table.selection_add(item)
 
 
+class HistoryFrame(ttk.Frame):
+	"""Sparklines of spread, mid-price and top of book imbalance of the selected pair."""
+	windows = {'15 min' : 900, '1 h' : 3600, '4 h' : 14400}
+	names = {'spread' : 'Spread', 'mid' : 'Mid', 'imbalance' : 'Imbalance'}
+
+	def __init__(self, parent):
+		ttk.Frame.__init__(self, parent, borderwidth=10, relief='groove')
+		self.drawn = None
+		self.lastdraw = 0.0
+
+		# init widgets
+		self.windowbox = ttk.Combobox(self, state='readonly', justify='left', width=6, values=list(HistoryFrame.windows))
+		self.windowbox.set('1 h')
+		self.canvases = {metric : tkinter.Canvas(self, width=160, height=50, highlightthickness=0, background='white') for metric in BTCe.History.metrics}
+		self.labels = {metric : ttk.Label(self, text=HistoryFrame.names[metric]) for metric in BTCe.History.metrics}
+
+		# frame layout
+		ttk.Label(self, text='History').grid(column=0, row=0, sticky='w')
+		self.windowbox.grid(column=0, row=0, sticky='e')
+		for i, metric in enumerate(BTCe.History.metrics):
+			self.labels[metric].grid(column=0, row=1 + 2 * i, sticky='w')
+			self.canvases[metric].grid(column=0, row=2 + 2 * i, sticky='nsew', pady=2)
+		self.grid_columnconfigure(0, weight=1)
+
+	def update(self, history, pair):
+		"""Redraw the sparklines at most once per second and only if new samples arrived."""
+		if not history or len(pair) != 2:
+			return
+		now = time.time()
+		window = self.windowbox.get()
+		drawn = (tuple(pair), window, history.total)
+		if drawn == self.drawn or now - self.lastdraw < 1.0:
+			return
+		self.drawn = drawn
+		self.lastdraw = now
+
+		seconds = HistoryFrame.windows[window]
+		for metric in BTCe.History.metrics:
+			canvas = self.canvases[metric]
+			canvas.delete('all')
+			stats = history.stats(metric, seconds, now)
+			if not stats:
+				self.labels[metric].config(text=HistoryFrame.names[metric])
+				continue
+			low, high, mean = stats
+			values = [format_float(round(value, 8)) for value in (history.last(metric), low, high, mean)]
+			self.labels[metric].config(text='{}: {} ({} - {}, avg {})'.format(HistoryFrame.names[metric], *values))
+
+			width = int(canvas.cget('width'))
+			height = int(canvas.cget('height'))
+			points = history.downsample(metric, width // 2, seconds, now)
+			scale = (height - 4) / (high - low) if high > low else 0.0
+			coords = []
+			for i, value in enumerate(points):
+				if value is None:
+					continue
+				coords.extend([2 * i, height - 2 - (value - low) * scale if scale else height / 2])
+			if len(coords) >= 4:
+				canvas.create_line(*coords, fill='blue')
+
+class RuleFrame(ttk.Frame):
+	"""Frame listing all price alerts and conditional orders. New rules use the selected pair and account."""
+	def __init__(self, parent):
+		ttk.Frame.__init__(self, parent, borderwidth=10, relief='groove')
+		self.version = -1
+
+		# init widgets
+		validatecommand = (self.register(validate_float), '%P')
+		self.kindbox = ttk.Combobox(self, state='readonly', justify='left', width=12, values=BTCe.Triggers.kinds)
+		self.kindbox.set(BTCe.Triggers.kinds[2])
+		self.typebox = ttk.Combobox(self, state='readonly', justify='left', width=5, values=['Sell', 'Buy'])
+		self.typebox.set('Sell')
+		self.thresholdvar = tkinter.StringVar(value='0')
+		self.amountvar = tkinter.StringVar(value='0')
+		self.ratevar = tkinter.StringVar(value='0')
+		thresholdentry = ttk.Entry(self, justify='right', validate='key', validatecommand=validatecommand, textvariable=self.thresholdvar)
+		amountentry = ttk.Entry(self, justify='right', validate='key', validatecommand=validatecommand, textvariable=self.amountvar)
+		rateentry = ttk.Entry(self, justify='right', validate='key', validatecommand=validatecommand, textvariable=self.ratevar)
+		self.table = ttk.Treeview(self, columns=['id', 'account', 'pair', 'rule', 'amount'], show='headings', height=3)
+		vsb = ttk.Scrollbar(self, orient='vertical', command=self.table.yview)
+		self.table.config(yscrollcommand=vsb.set)
+
+		# frame layout
+		ttk.Label(self, text='Rules').grid(column=0, row=0, sticky='w')
+		self.kindbox.grid(column=0, row=1, sticky='w')
+		self.typebox.grid(column=1, row=1, sticky='e')
+		ttk.Label(self, text='Trigger:').grid(column=0, row=2, sticky='w')
+		thresholdentry.grid(column=1, row=2, sticky='nsew')
+		ttk.Label(self, text='Amount:').grid(column=0, row=3, sticky='w')
+		amountentry.grid(column=1, row=3, sticky='nsew')
+		ttk.Label(self, text='Rate:').grid(column=0, row=4, sticky='w')
+		rateentry.grid(column=1, row=4, sticky='nsew')
+		ttk.Button(self, text='Add Rule', command=self.addrule).grid(column=0, row=5, sticky='w')
+		ttk.Button(self, text='Remove Rule(s)', command=self.removerules).grid(column=1, row=5, sticky='e')
+		self.table.grid(column=0, row=6, sticky='nsew', columnspan=2)
+		vsb.grid(column=2, row=6, sticky='ns')
+		self.grid_columnconfigure(0, weight=0)
+		self.grid_columnconfigure(1, weight=1)
+		self.grid_columnconfigure(2, weight=0)
+		self.grid_rowconfigure(6, weight=1, pad=5)
+
+		# table layout
+		self.table.heading('id', text='ID', anchor='w')
+		self.table.heading('account', text='Account', anchor='w')
+		self.table.heading('pair', text='Pair', anchor='w')
+		self.table.heading('rule', text='Rule', anchor='w')
+		self.table.heading('amount', text='Amount', anchor='w')
+		self.table.column('id', width=20)
+		self.table.column('account', width=50)
+		self.table.column('pair', width=50)
+		self.table.column('rule', width=120)
+		self.table.column('amount', width=50)
+
+	def addrule(self):
+		"""Add a rule with the current entries (a rate of 0 uses the triggering price)."""
+		values = [self.thresholdvar.get(), self.amountvar.get(), self.ratevar.get()]
+		values = [float(value) if value else 0.0 for value in values]
+		self.master.addrule(self.kindbox.get(), self.typebox.get().lower(), *values)
+
+	def removerules(self):
+		"""Remove all selected rules."""
+		for select in self.table.selection():
+			self.master.triggers.remove(int(self.table.item(select)['values'][0]))
+
+	def update(self, triggers):
+		"""Rebuild the rule table if the rules changed."""
+		if triggers.version == self.version:
+			return
+		self.version = triggers.version
+		self.table.delete(*self.table.get_children())
+		for rule in triggers.list():
+			if rule['kind'].startswith('Alert'):
+				text = '{} {} {}'.format(rule['kind'], rule['type'], format_float(rule['threshold']))
+			else:
+				rate = format_float(rule['rate']) if rule['rate'] else 'trigger'
+				text = '{} {} {} at {}'.format(rule['kind'], rule['type'], format_float(rule['threshold']), rate)
+			amount = format_float(rule['amount']) if rule['amount'] else ''
+			self.table.insert('', 'end', values=[rule['id'], rule['account'], rule['pair'].upper().replace('_', '/'), text, amount])
+
 class BalanceFrame(ttk.Frame):
 	"""Tree view for personal balances."""
 	def __init__(self, parent):
 		ttk.Frame.__init__(self, parent, borderwidth=10, relief='groove')
+		self.rows = {}
+		self.currencies = []
+		self.total = ''
 
 		# init widgets
-		self.table = ttk.Treeview(self, columns = ['curr', 'funds'], show='headings')
+		self.table = ttk.Treeview(self, columns = ['curr', 'funds', 'value'], show='headings')
 		vsb = ttk.Scrollbar(self, orient='vertical', command=self.table.yview)
 		self.table.configure(yscrollcommand = vsb.set)
+		self.totallabel = ttk.Label(self, text='Total:')
+		self.basebox = ttk.Combobox(self, state='readonly', justify='left', width=5, values=['USD'])
+		self.basebox.set('USD')
 
 		# frame layout
 		ttk.Label(self, text='Funds').grid(column=0, row=0, columnspan=2, sticky='w')
-		self.table.grid(column=0, row=1, sticky='nsew')
-		vsb.grid(column=1, row=1, sticky='ns')
+		self.totallabel.grid(column=0, row=1, sticky='w')
+		self.basebox.grid(column=0, row=1, columnspan=2, sticky='e')
+		self.table.grid(column=0, row=2, sticky='nsew')
+		vsb.grid(column=1, row=2, sticky='ns')
 		self.grid_columnconfigure(0, weight=1)
 		self.grid_rowconfigure(0, weight=0)
-		self.grid_rowconfigure(1, weight=1)
+		self.grid_rowconfigure(1, weight=0, pad=5)
+		self.grid_rowconfigure(2, weight=1)
 
 		# table layout
 		self.table.column('curr', width=60)
 		self.table.column('funds', width=100)
+		self.table.column('value', width=100)
 		self.table.heading('curr', text='Currency', anchor='w')
 		self.table.heading('funds', text='Balance', anchor='w')
+		self.table.heading('value', text='Value', anchor='w')
 
-	def update(self, funds):
-		"""Clear and rebuild the balance table."""
-		if not funds:
+	def update_currencies(self, pairs):
+		"""Update available base currencies."""
+		if not pairs:
 			return
+		currencies = sorted({curr.upper() for pair in pairs for curr in pair.split('_')})
+		if currencies != self.currencies:
+			self.currencies = currencies
+			self.basebox.config(values=currencies)
 
-		# store old selection keys
-		selects = self.table.selection()
-		selectcurrs = []
-		for select in selects:
-			selectcurrs.append(self.table.item(select)['values'][0])
-
-		# delete old entries
-		for entry in self.table.get_children():
-			self.table.delete(entry)
-
-		# insert new sorted entries and select old keys
-		funds = list(funds.items())
-		funds.sort()
-		for fund in funds:
-			curr = fund[0].upper()
-			item = self.table.insert('', 'end', values=[curr, format_float(fund[1])])
-			if curr in selectcurrs:
-				self.table.selection_add(item)
+	def update(self, funds, values = None, total = None, base = '', complete = True):
+		"""Update changed rows of the balance table and the total value (marked as a lower bound if not complete)."""
+		if not funds:
+			# no funds for the selected account(s), don't leave the previous ones on screen
+			self.table.delete(*self.rows)
+			self.rows = {}
+			if self.total != 'Total:':
+				self.total = 'Total:'
+				self.totallabel.config(text=self.total)
+			return
+		values = values if values else {}
+
+		# update total value header
+		text = 'Total: {}{} {}'.format('' if complete else '\u2265 ', format_float(total), base.upper()) if total is not None else 'Total:'
+		if text != self.total:
+			self.total = text
+			self.totallabel.config(text=text)
+
+		# delete rows of vanished currencies
+		for curr in [curr for curr in self.rows if not curr in funds]:
+			self.table.delete(curr)
+			del self.rows[curr]
+
+		# insert new rows in sorted order and only touch rows whose values changed
+		for index, curr in enumerate(sorted(funds)):
+			value = values.get(curr)
+			row = [curr.upper(), format_float(funds[curr]), format_float(value) if value is not None else '']
+			if not curr in self.rows:
+				self.table.insert('', index, iid=curr, values=row)
+			elif self.rows[curr] != row:
+				self.table.item(curr, values=row)
+			self.rows[curr] = row
 
 class Main(tkinter.Tk):
 	"""Main frame."""
@@ -405,26 +586,40 @@ class Main(tkinter.Tk):
 		tkinter.Tk.__init__(self)
 		self.title('BTCeGUI')
 		self.lockdata = threading.Lock()
-		self.locknonce = threading.Lock()
+		self.apis = {api.name : api for api in apis}
 		self.info = {}
 		self.depth = {}
 		self.userinfo = {}
-		self.orders={}
+		self.orders = {}
 		self.pair = {}
+		self.account = ''
+		self.valuation = BTCe.Valuation()
+		self.triggers = BTCe.Triggers('BTCeRules.json')
+		self.feed = BTCe.Feed.fromconfig('BTCe.ini')
+		self.histories = {}
+		self.feed.listen(self.ondepth, onerror=self.onfeederror)
+		self.tickers = {}
+		self.rates = {}
+		self.ratesbase = ''
+		self.base = 'usd'
 		self.run = True
 		self.buying = False
 		self.selling = False
 		self.cancelling = False
 
 		# layout
-		self.geometry('800x800+100+100')
+		self.geometry('1000x800+100+100')
 		self.currencybox = CurrencyBox(self)
 		self.currencybox.grid(column=0, row=0, stick='nw')
+		self.accountbox = AccountBox(self, self.apis.keys())
+		self.accountbox.grid(column=1, row=0, stick='nw')
 
 		self.buybox = TradeFrame(self, 'Buy')
 		self.buybox.grid(column=0, row=1, sticky='nsew', padx=20, pady=5)
 		self.sellbox = TradeFrame(self, 'Sell')
 		self.sellbox.grid(column=1, row=1, sticky='nsew', padx=20, pady=5)
+		self.ruleframe = RuleFrame(self)
+		self.ruleframe.grid(column=2, row=1, sticky='nsew', padx=5, pady=5)
 
 		self.askframe = DepthFrame(self, 'Ask')
 		self.askframe.grid(column=0, row=2, sticky='nsew', padx=5, pady=5)
@@ -432,18 +627,21 @@ class Main(tkinter.Tk):
 		self.bidframe.grid(column=1, row=2, sticky='nsew', padx=5, pady=5)
 		self.balanceframe = BalanceFrame(self)
 		self.balanceframe.grid(column=2, row=2, sticky='nsew', padx=5, pady=5)
+		self.historyframe = HistoryFrame(self)
+		self.historyframe.grid(column=3, row=2, sticky='nsew', padx=5, pady=5)
 
 		self.orderframe = OrderFrame(self)
-		self.orderframe.grid(column=0, row=3, sticky='nsew', padx=5, pady=5, columnspan=3)
+		self.orderframe.grid(column=0, row=3, sticky='nsew', padx=5, pady=5, columnspan=4)
 
 		self.console = ConsoleFrame(self)
-		self.console.grid(column=0, row=4, sticky='nsew', padx=5, pady=5, columnspan=3)
+		self.console.grid(column=0, row=4, sticky='nsew', padx=5, pady=5, columnspan=4)
 		global console
 		console = self.console
 
 		self.grid_columnconfigure(0, weight=1)
 		self.grid_columnconfigure(1, weight=1)
 		self.grid_columnconfigure(2, weight=0)
+		self.grid_columnconfigure(3, weight=0)
 		self.grid_rowconfigure(0, weight=0)
 		self.grid_rowconfigure(1, weight=0)
 		self.grid_rowconfigure(2, weight=1)
@@ -454,20 +652,29 @@ class Main(tkinter.Tk):
 		self.askframe.table.bind('<Double-1>', lambda event: self.ondouble_depth(self.askframe.table, self.buybox, event))
 		self.bidframe.table.bind('<Double-1>', lambda event: self.ondouble_depth(self.bidframe.table, self.sellbox, event))
 
-		# api threads
-		if api.secret == b'copy API secret here' or api.key == b'copy API key here':
-			console.print('No API secret/key found. Only public data available.')
-		else:
-			threading.Thread(target=self.update_userinfo_loop).start()
-			threading.Thread(target=self.update_orders_loop).start()
-		threading.Thread(target=self.update_depth_loop).start()
+	def start(self):
+		"""Start polling threads and GUI syncing."""
+		if self.triggers.loaderror:
+			console.print('[WARNING] {}'.format(self.triggers.loaderror))
+		for warning in accountwarnings:
+			console.print('[WARNING] {}'.format(warning))
+		# api threads, two per account so that accounts are polled in parallel
+		for api in self.apis.values():
+			if api.secret == b'copy API secret here' or api.key == b'copy API key here':
+				console.print('No API secret/key found for account {}. Only public data available.'.format(api.name))
+			else:
+				threading.Thread(target=self.update_userinfo_loop, args=[api]).start()
+				threading.Thread(target=self.update_orders_loop, args=[api]).start()
+		self.feed.start()
 		threading.Thread(target=self.update_info_loop).start()
+		threading.Thread(target=self.update_tickers_loop).start()
 
 		self.sync()
 
 	def exit(self):
 		"""Stop running threads."""
 		self.run = False
+		self.feed.stop()
 		# redirect console prints to the normal console
 		global console
 		console = Console()
@@ -481,21 +688,39 @@ class Main(tkinter.Tk):
 	def sync(self):
 		"""Sync GUI to states."""
 		self.lockdata.acquire()
-		userinfo = copy.copy(self.userinfo)
-		orders = copy.copy(self.orders)
+		userinfos = copy.copy(self.userinfo)
+		accountorders = copy.copy(self.orders)
 		info = copy.copy(self.info)
 		depth = copy.copy(self.depth)
+		rates = self.rates
+		ratesbase = self.ratesbase
 		self.pair = copy.copy(self.currencybox.get().split('/'))
+		self.feed.subscribe('_'.join(self.pair).lower() if len(self.pair) == 2 else '')
+		self.account = self.accountbox.get()
+		account = self.account
+		self.base = self.balanceframe.basebox.get().lower()
+		base = self.base
 		self.lockdata.release()
 
 		pairs = None
 		if info:
 			pairs = info.get('pairs')
 		self.currencybox.update(pairs)
+		self.balanceframe.update_currencies(pairs)
 
+		# restrict user data to the selected account or aggregate it over all accounts
+		names = [account] if account in self.apis else list(self.apis.keys())
+		userinfos = [userinfos[name] for name in names if userinfos.get(name)]
 		funds = None
-		if userinfo:
-			funds = userinfo.get('funds')
+		for userinfo in userinfos:
+			if userinfo.get('funds'):
+				funds = funds if funds else {}
+				for curr, balance in userinfo['funds'].items():
+					funds[curr] = funds.get(curr, 0.0) + float(balance)
+		orders = {}
+		for name in names:
+			if accountorders.get(name):
+				orders.update(accountorders[name])
 
 		# update depth tables
 		fee = 0
@@ -507,86 +732,82 @@ class Main(tkinter.Tk):
 			depth = depth[pair]
 			pair = pair.upper().split('_')
 
-		cantrade = True if userinfo and userinfo['rights']['trade'] == 1 else False
+		cancancel = any(userinfo['rights']['trade'] == 1 for userinfo in userinfos)
+		cantrade = cancancel and len(names) == 1
 
 		self.askframe.update(depth, pair)
 		self.bidframe.update(depth, pair)
-		self.balanceframe.update(funds)
+		values, total, complete = BTCe.Valuation.value(funds, rates) if funds and ratesbase == base else (None, None, True)
+		self.balanceframe.update(funds, values, total, base, complete)
 		self.buybox.update(pair, funds, fee, cantrade, self.buying)
 		self.sellbox.update(pair, funds, fee, cantrade, self.selling)
-		self.orderframe.update(orders, cantrade, self.cancelling)
+		self.orderframe.update(orders, cancancel, self.cancelling)
+		self.ruleframe.update(self.triggers)
+		if len(self.pair) == 2:
+			self.historyframe.update(self.histories.get('_'.join(self.pair).lower()), self.pair)
 		self.console.update()
 
 		self.after(100, self.sync)
 
-	def update_depth_loop(self):
-		while self.run:
-			self.update_depth()
-			time.sleep(1.0)
-
-	def update_depth(self):
-		# if currency pair is valid get depth table
+	def ondepth(self, pair, depth):
+		"""Store depth pushed by the feed and evaluate rules of the pair on the feed thread."""
 		self.lockdata.acquire()
-		pair = copy.copy(self.pair)
+		self.depth = {pair : depth} if depth else None
+		history = self.histories.get(pair)
+		if history is None:
+			history = self.histories[pair] = BTCe.History()
 		self.lockdata.release()
-		depth = {}
-		if len(pair) == 2:
-			depth = BTCe.API.depth('_'.join(pair).lower())
-			if depth and 'success' in depth.keys():
-				if depth['success'] == 1:
-					depth = depth['return']
-				else:
-					console.print('[WARNING] Error requesting depth: {}'.format(depth['error']))
-					depth = None
-			self.lockdata.acquire()
-			self.depth = depth
-			self.lockdata.release()
+		if depth:
+			history.record(depth)
+			bid = depth['bids'][0][0] if depth.get('bids') else None
+			ask = depth['asks'][0][0] if depth.get('asks') else None
+			self.fire(self.triggers.evaluate(pair, bid, ask))
+
+	def onfeederror(self, text):
+		console.print('[WARNING] {}'.format(text))
 
-	def update_userinfo_loop(self):
+	def update_userinfo_loop(self, api):
 		acc = 0.0
 		while self.run:
-			self.update_userinfo()
+			self.update_userinfo(api)
 			while acc < 5.0 and self.run:
 				time.sleep(0.5)
 				acc += 0.5
 			acc = 0.0
 
-	def update_userinfo(self):
-			self.locknonce.acquire()
+	def update_userinfo(self, api):
 			userinfo = api.getinfo()
-			self.locknonce.release()
 			if userinfo and 'success' in userinfo.keys():
 				if userinfo['success'] == 1:
 					userinfo = userinfo['return']
 				else:
-					console.print('[WARNING] Error requesting user info: {}'.format(userinfo['error']))
+					console.print('[WARNING] Error requesting user info for account {}: {}'.format(api.name, userinfo['error']))
 					userinfo = None
 			self.lockdata.acquire()
-			self.userinfo = userinfo
+			self.userinfo[api.name] = userinfo
 			self.lockdata.release()
 
-	def update_orders_loop(self):
+	def update_orders_loop(self, api):
 		acc = 0.0
 		while self.run:
-			self.update_orders()
+			self.update_orders(api)
 			while acc < 10.0 and self.run:
 				time.sleep(0.5)
 				acc += 0.5
 			acc = 0.0
 
-	def update_orders(self):
-		self.locknonce.acquire()
+	def update_orders(self, api):
 		orders = api.activeorders()
-		self.locknonce.release()
 		if orders and 'success' in orders.keys():
 			if orders['success'] == 1:
-				orders = orders['return']
+				# tag orders with their account for the aggregated view
+				orders = {id : dict(order, account=api.name) for id, order in orders['return'].items()}
 			else:
 				if orders['error'] != 'no orders':
-					console.print('[WARNING] Error requesting open orders: {}'.format(orders['error']))
+					console.print('[WARNING] Error requesting open orders for account {}: {}'.format(api.name, orders['error']))
 				orders = None
 		self.lockdata.acquire()
-		self.orders = orders
+		self.orders[api.name] = orders
 		self.lockdata.release()
 
 	def update_info_loop(self):
@@ -616,8 +837,91 @@ class Main(tkinter.Tk):
 				acc += 0.5
 			acc = 0.0
 
+	def update_tickers_loop(self):
+		acc = 0.0
+		while self.run:
+			self.update_tickers()
+			while acc < 5.0 and self.run:
+				time.sleep(0.5)
+				acc += 0.5
+			acc = 0.0
+
+	def update_tickers(self):
+		# conversion paths are only rebuilt when the pair list or the base currency changed
+		self.lockdata.acquire()
+		pairs = self.info.get('pairs') if self.info else None
+		base = self.base
+		self.lockdata.release()
+		if not pairs:
+			return
+		self.valuation.update(pairs.keys(), base)
+		tickers = self.valuation.fetch([pair for pair in self.triggers.pairs() if pair in pairs])
+		if tickers and 'success' in tickers.keys():
+			console.print('[WARNING] Error requesting tickers: {}'.format(tickers['error']))
+			tickers = {}
+		# price every currency once per fetch, syncing the GUI only multiplies balances
+		rates = self.valuation.rates(tickers)
+		self.lockdata.acquire()
+		self.tickers = tickers
+		self.rates = rates
+		self.ratesbase = self.valuation.base
+		self.lockdata.release()
+		for pair, ticker in tickers.items():
+			self.fire(self.triggers.evaluate(pair, ticker.get('sell'), ticker.get('buy')))
+
+	def addrule(self, kind, type, threshold, amount, rate):
+		"""Add a rule for the selected pair and account."""
+		pair = '_'.join(self.currencybox.get().split('/')).lower()
+		account = self.accountbox.get()
+		self.lockdata.acquire()
+		pairs = self.info.get('pairs') if self.info else None
+		self.lockdata.release()
+		if not pairs or not pair in pairs:
+			console.print('[WARNING] Select a currency pair before adding a rule.')
+			return
+		if threshold <= 0.0:
+			console.print('[WARNING] Rules need a trigger price.')
+			return
+		if not kind.startswith('Alert') and (amount <= 0.0 or not account in self.apis):
+			console.print('[WARNING] Conditional orders need an amount and a single selected account.')
+			return
+		rule = self.triggers.add(pair, kind, type, threshold, amount, rate, account if account in self.apis else '')
+		console.print('Added rule {}.'.format(rule['id']))
+
+	def fire(self, rules):
+		"""Report fired alerts and place fired orders right away on the calling polling thread."""
+		for rule in rules:
+			pair = rule['pair'].upper().replace('_', '/')
+			if rule['kind'].startswith('Alert'):
+				console.print('[ALERT] Rule {}: {} {} {} reached {}.'.format(rule['id'], pair, rule['kind'].lower(), format_float(rule['threshold']), format_float(rule['price'])))
+				continue
+			api = self.apis.get(rule['account'])
+			if not api:
+				console.print('[WARNING] Rule {} fired for unknown account {}.'.format(rule['id'], rule['account']))
+				continue
+			rate = rule['rate'] if rule['rate'] else rule['price']
+			console.print('Rule {} ({}) fired at {}. Placing order {} for account {}.'.format(rule['id'], rule['kind'].lower(), format_float(rule['price']), [rule['pair'], rule['type'], rate, rule['amount']], api.name))
+			response = api.trade(rule['pair'], rule['type'], rate, rule['amount'])
+			error = response.get('error') if response else 'No response.'
+			if response and response.get('success') == 1:
+				console.print('Order placed successfully.')
+			elif BTCe.API.uncertain(response):
+				# the order may exist already, so the rule must not place it again
+				console.print('[WARNING] Order of rule {} may have been placed: {}. Rule disabled, check the open orders.'.format(rule['id'], error))
+				self.update_orders(api)
+			elif self.triggers.rearm(rule):
+				console.print('[WARNING] Error placing order: {}. Rule {} retries in {} s.'.format(error, rule['id'], int(BTCe.Triggers.backoff * 2 ** rule.get('failures', 0))))
+			else:
+				console.print('[WARNING] Error placing order: {}. Rule {} disabled after {} retries.'.format(error, rule['id'], BTCe.Triggers.retries))
+
 	def placeorder(self, pair, type, rate, amount):
-		console.print('Placing order {}.'.format([pair, type, rate, amount]))
+		self.lockdata.acquire()
+		api = self.apis.get(self.account)
+		self.lockdata.release()
+		if not api:
+			return
+
+		console.print('Placing order {} for account {}.'.format([pair, type, rate, amount], api.name))
 		if type == 'buy':
 			self.buying = True
 		elif type == 'sell':
@@ -625,9 +929,7 @@ class Main(tkinter.Tk):
 		else:
 			return
 
-		self.locknonce.acquire()
 		response = api.trade(pair, type, rate, amount)
-		self.locknonce.release()
 
 		if response and 'success' in response.keys():
 			if response['success'] == 1:
@@ -635,30 +937,41 @@ class Main(tkinter.Tk):
 			else:
 				console.print('[WARNING] Error placing order: {}'.format(response['error']))
 
-		self.update_orders()
-		self.update_userinfo()
-		
+		self.update_orders(api)
+		self.update_userinfo(api)
+
 		if type == 'buy':
 			self.buying = False
 		elif type == 'sell':
 			self.selling = False
 
-	def cancelorders(self, ids):
+	def cancelorders(self, orders):
+		"""Cancel (account, id) orders with one thread per account."""
 		self.cancelling = True
+		accountids = {}
+		for name, id in orders:
+			accountids.setdefault(name, []).append(id)
+		threads = [threading.Thread(target=self.cancelorders_account, args=[self.apis[name], ids]) for name, ids in accountids.items() if name in self.apis]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.cancelling = False
+
+	def cancelorders_account(self, api, ids):
 		for id in ids:
-			console.print('Cancel order {}.'.format(id))
-			self.locknonce.acquire()
+			console.print('Cancel order {} for account {}.'.format(id, api.name))
 			response = api.cancelorder(id)
-			self.locknonce.release()
 			if response and 'success' in response.keys():
 				if response['success'] == 1:
 					console.print('Order cancelled successfully.')
 				else:
 					console.print('[WARNING] Error cancelling order: {}'.format(response['error']))
-		self.update_orders()
-		self.update_userinfo()
-		self.cancelling = False
-
-root = Main()
-root.mainloop()
-root.exit()
\ No newline at end of file
+		self.update_orders(api)
+		self.update_userinfo(api)
+
+if __name__ == '__main__':
+	root = Main()
+	root.start()
+	root.mainloop()
+	root.exit()
@@ -0,0 +1,145 @@
+#! python3
+import argparse
+import threading
+import socket
+import random
+import json
+import time
+import BTCe
+
+class Market:
+	"""Synthetic order book of one currency pair that random walks and emits sequenced diffs."""
+	def __init__(self, pair, price, rng, levels = 200):
+		self.pair = pair
+		self.price = price
+		self.rng = rng
+		self.seq = 0
+		self.tid = 0
+		self.book = BTCe.Book()
+		self.tick = round(price / 10000.0, 8)
+		asks = [[round(price + self.tick * (i + 1), 8), self.amount()] for i in range(levels)]
+		bids = [[round(price - self.tick * (i + 1), 8), self.amount()] for i in range(levels)]
+		self.book.reset(asks, bids, 0)
+
+	def amount(self):
+		return round(self.rng.uniform(0.01, 20.0), 8)
+
+	def snapshot(self):
+		depth = self.book.depth(None)
+		return {'type' : 'snapshot', 'pair' : self.pair, 'seq' : self.seq, 'asks' : depth['asks'], 'bids' : depth['bids']}
+
+	def step(self):
+		"""Return the next messages: a trade at the top of the book and its depth diff or a diff of a few levels."""
+		self.seq += 1
+		depth = self.book.depth(20)
+		if self.rng.random() < 0.1 and depth['asks'] and depth['bids']:
+			# a trade takes out the best level of one side
+			side = self.rng.choice(['asks', 'bids'])
+			rate, amount = depth[side][0]
+			self.book.apply(side, [[rate, 0]])
+			self.tid += 1
+			trade = {'type' : 'bid' if side == 'asks' else 'ask', 'price' : rate, 'amount' : amount, 'tid' : self.tid, 'timestamp' : int(time.time())}
+			self.seq += 1
+			diff = {'type' : 'depth', 'pair' : self.pair, 'seq' : self.seq, 'asks' : [], 'bids' : []}
+			diff[side].append([rate, 0])
+			return [{'type' : 'trades', 'pair' : self.pair, 'seq' : self.seq - 1, 'trades' : [trade]}, diff]
+
+		# move some levels near the top, delete or add others
+		self.price += self.rng.choice([-1, 1]) * self.tick
+		diff = {'asks' : [], 'bids' : []}
+		for side, sign in (('asks', 1.0), ('bids', -1.0)):
+			for level in depth[side][:5]:
+				if self.rng.random() < 0.3:
+					diff[side].append([level[0], 0 if self.rng.random() < 0.3 else self.amount()])
+			rate = round(self.price + sign * self.tick * self.rng.randint(1, 10), 8)
+			# keep the new level on its side of the opposite best so the book never crosses
+			opposite = self.book.depth(1)['bids' if side == 'asks' else 'asks']
+			if opposite and sign * (rate - opposite[0][0]) <= 0.0:
+				rate = round(opposite[0][0] + sign * self.tick, 8)
+			diff[side].append([rate, self.amount()])
+			self.book.apply(side, diff[side])
+		return [{'type' : 'depth', 'pair' : self.pair, 'seq' : self.seq, 'asks' : diff['asks'], 'bids' : diff['bids']}]
+
+class Server:
+	"""WebSocket server streaming synthetic depth diffs and trades in the format StreamFeed expects."""
+	def __init__(self, host, port, pairs, rate, drop, seed):
+		self.host = host
+		self.port = port
+		self.rate = rate
+		self.drop = drop
+		self.rng = random.Random(seed)
+		self.lock = threading.Lock()
+		self.markets = {pair : Market(pair, price, self.rng) for pair, price in pairs.items()}
+		self.clients = {}
+
+	def serve(self):
+		listener = socket.create_server((self.host, self.port))
+		threading.Thread(target=self.generate, daemon=True).start()
+		print('Streaming {} on ws://{}:{}/'.format(', '.join(sorted(self.markets)), self.host, self.port))
+		while True:
+			conn, addr = listener.accept()
+			threading.Thread(target=self.handle, args=[conn], daemon=True).start()
+
+	def handle(self, conn):
+		"""Answer subscribe, unsubscribe and snapshot requests of one client."""
+		try:
+			ws = BTCe.WebSocket.accept(conn)
+		except OSError:
+			return
+		with self.lock:
+			self.clients[ws] = set()
+		try:
+			while True:
+				request = json.loads(ws.recv())
+				pair = request.get('pair')
+				if not pair in self.markets:
+					ws.send(json.dumps({'type' : 'error', 'pair' : pair, 'error' : 'Unknown pair.'}))
+					continue
+				# snapshots are sent under the lock so no diff can slip in between
+				with self.lock:
+					if request['op'] == 'subscribe':
+						self.clients[ws].add(pair)
+						ws.send(json.dumps(self.markets[pair].snapshot()))
+					elif request['op'] == 'unsubscribe':
+						self.clients[ws].discard(pair)
+					elif request['op'] == 'snapshot':
+						ws.send(json.dumps(self.markets[pair].snapshot()))
+		except (OSError, ValueError):
+			pass
+		finally:
+			with self.lock:
+				del self.clients[ws]
+			conn.close()
+
+	def generate(self):
+		"""Step every market rate times per second and broadcast to subscribers, dropping some messages."""
+		while True:
+			with self.lock:
+				for pair, market in self.markets.items():
+					for message in market.step():
+						if self.rng.random() < self.drop:
+							continue
+						message = json.dumps(message)
+						for ws, pairs in list(self.clients.items()):
+							if pair in pairs:
+								try:
+									ws.send(message)
+								except OSError:
+									pass
+			time.sleep(1.0 / self.rate)
+
+def main():
+	parser = argparse.ArgumentParser(description='Local stand-in stream server for testing the BTCeGUI streaming feed.')
+	parser.add_argument('--host', default='localhost')
+	parser.add_argument('--port', type=int, default=8765)
+	parser.add_argument('--pairs', nargs='+', default=['btc_usd=600', 'ltc_usd=10', 'ltc_btc=0.017'], help='pair=start price')
+	parser.add_argument('--rate', type=float, default=20.0, help='messages per second and pair')
+	parser.add_argument('--drop', type=float, default=0.0, help='probability of dropping a message to provoke a resync')
+	parser.add_argument('--seed', type=int, default=0, help='seed for synthetic data')
+	args = parser.parse_args()
+
+	pairs = {pair : float(price) for pair, price in (arg.split('=') for arg in args.pairs)}
+	Server(args.host, args.port, pairs, args.rate, args.drop, args.seed).serve()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,422 @@
+#! python3
+import unittest
+import json
+import socket
+import tempfile
+import os.path
+import http.client
+import unittest.mock
+import BTCe
+
+class FakeResponse:
+	def __init__(self, text):
+		self.text = text
+
+	def read(self):
+		return self.text.encode('utf-8')
+
+class FakeConnection:
+	"""Stand-in for HTTPSConnection that answers from a script of responses or exceptions."""
+	script = []
+	connections = []
+
+	def __init__(self, host, timeout = None):
+		self.requests = []
+		self.closed = False
+		FakeConnection.connections.append(self)
+
+	def request(self, method, url, body, headers):
+		self.requests.append(body)
+		self.result = FakeConnection.script.pop(0)
+		if isinstance(self.result, Exception):
+			raise self.result
+
+	def getresponse(self):
+		return FakeResponse(self.result)
+
+	def close(self):
+		self.closed = True
+
+class APITest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.dir.name, 'BTCe.ini')
+		FakeConnection.script = []
+		FakeConnection.connections = []
+		patch = unittest.mock.patch.object(http.client, 'HTTPSConnection', FakeConnection)
+		patch.start()
+		self.addCleanup(patch.stop)
+		self.api = BTCe.API(self.path)
+
+	def tearDown(self):
+		self.dir.cleanup()
+
+	def write(self, text):
+		with open(self.path, 'w') as file:
+			file.write(text)
+
+	def test_accountname(self):
+		self.assertEqual(BTCe.API.accountname('API'), 'Default')
+		self.assertEqual(BTCe.API.accountname('API:sub1'), 'sub1')
+		self.assertEqual(BTCe.API.accountname('API: sub2 '), 'sub2')
+
+	def test_sections(self):
+		self.assertEqual(BTCe.API.sections(self.path), ['API'])
+		self.write('[API]\nkey = a\n[Feed]\ntype = poll\n[API:sub1]\nkey = b\n[APIX]\n')
+		self.assertEqual(BTCe.API.sections(self.path), ['API', 'API:sub1'])
+
+	def test_accounts(self):
+		self.write('[API]\nkey = a\n[API:default]\nkey = b\n[API:All]\nkey = c\n[API:sub1]\nkey = d\n')
+		apis, warnings = BTCe.API.accounts(self.path)
+		self.assertEqual([api.name for api in apis], ['Default', 'sub1'])
+		self.assertEqual([api.key for api in apis], [b'a', b'd'])
+		self.assertEqual(len(warnings), 2)
+
+	def test_accounts_fallback(self):
+		self.write('[API:All]\nkey = a\n')
+		apis, warnings = BTCe.API.accounts(self.path)
+		self.assertEqual([api.section for api in apis], ['API'])
+		self.assertEqual(len(warnings), 1)
+
+	def test_keepalive(self):
+		FakeConnection.script = ['{"success" : 1, "return" : 1}', '{"success" : 1, "return" : 2}']
+		self.assertEqual(self.api.getinfo()['return'], 1)
+		self.assertEqual(self.api.getinfo()['return'], 2)
+		self.assertEqual(len(FakeConnection.connections), 1)
+
+	def test_resend_after_idle_drop(self):
+		FakeConnection.script = ['{"success" : 1, "return" : 1}', http.client.RemoteDisconnected('closed'), '{"success" : 1, "return" : 2}']
+		self.api.getinfo()
+		self.assertEqual(self.api.trade('btc_usd', 'buy', 100.0, 1.0)['return'], 2)
+		first, second = FakeConnection.connections
+		self.assertTrue(first.closed)
+		# the resend carries the same nonce
+		self.assertEqual(len(first.requests), 2)
+		self.assertEqual(second.requests, first.requests[1:])
+		self.assertEqual(FakeConnection.script, [])
+
+	def test_resend_hits_used_nonce(self):
+		FakeConnection.script = ['{"success" : 1, "return" : 1}', BrokenPipeError(), '{"success" : 0, "error" : "invalid nonce parameter; on key:2, you sent:2"}', '{"success" : 1, "return" : 3}']
+		self.api.getinfo()
+		response = self.api.trade('btc_usd', 'buy', 100.0, 1.0)
+		self.assertEqual(response['success'], 0)
+		self.assertIn('may have been processed', response['error'])
+		self.assertTrue(BTCe.API.uncertain(response))
+		# the trade is not sent a third time with a new nonce
+		self.assertEqual(len(FakeConnection.script), 1)
+		self.assertEqual(self.api.nonce, 2)
+
+	def test_uncertain(self):
+		FakeConnection.script = ['{"success" : 0, "error" : "It is not enough USD for purchase"}', socket.timeout('timed out'), '<html>Bad Gateway</html>']
+		rejected = self.api.trade('btc_usd', 'buy', 100.0, 1.0)
+		self.assertFalse(BTCe.API.uncertain(rejected))
+		# a timeout or an unreadable response may hide a placed order
+		self.assertTrue(BTCe.API.uncertain(self.api.trade('btc_usd', 'buy', 100.0, 1.0)))
+		self.assertTrue(BTCe.API.uncertain(self.api.trade('btc_usd', 'buy', 100.0, 1.0)))
+		self.assertTrue(BTCe.API.uncertain(None))
+		self.assertFalse(BTCe.API.uncertain({'success' : 1, 'return' : {}}))
+
+	def test_nonce_retry(self):
+		FakeConnection.script = ['{"success" : 0, "error" : "invalid nonce parameter; on key:41, you sent:1"}', '{"success" : 1, "return" : 1}']
+		self.assertEqual(self.api.getinfo()['return'], 1)
+		self.assertEqual(self.api.nonce, 42)
+
+	def test_fresh_connection_fails(self):
+		FakeConnection.script = [ConnectionRefusedError('refused')]
+		with self.assertRaises(ConnectionRefusedError):
+			self.api.post(b'', {})
+		self.assertIsNone(self.api.conn)
+		FakeConnection.script = [ConnectionRefusedError('refused')]
+		response = self.api.getinfo()
+		self.assertEqual(response['success'], 0)
+		self.assertEqual(len(FakeConnection.connections), 2)
+
+class ValuationTest(unittest.TestCase):
+	def setUp(self):
+		self.valuation = BTCe.Valuation()
+		self.valuation.update(['btc_usd', 'ltc_usd', 'ltc_btc', 'nmc_btc'])
+		self.tickers = {
+			'btc_usd' : {'buy' : 101.0, 'sell' : 100.0},
+			'ltc_usd' : {'buy' : 9.5, 'sell' : 9.0},
+			'ltc_btc' : {'buy' : 0.11, 'sell' : 0.1},
+			'nmc_btc' : {'buy' : 0.02, 'sell' : 0.01},
+		}
+
+	def test_best_path(self):
+		# selling ltc for btc and btc for usd beats selling ltc for usd directly
+		self.assertAlmostEqual(self.valuation.rate('ltc', self.tickers), 10.0)
+		self.tickers['ltc_usd']['sell'] = 11.0
+		self.assertAlmostEqual(self.valuation.rate('ltc', self.tickers), 11.0)
+
+	def test_buy_side(self):
+		# usd in btc buys btc at the ask, or ltc at its ask to sell it for btc if that is cheaper
+		self.valuation.update(self.valuation.pairs, 'btc')
+		self.assertAlmostEqual(self.valuation.rate('usd', self.tickers), 0.1 / 9.5)
+		self.tickers['ltc_usd']['buy'] = 20.0
+		self.assertAlmostEqual(self.valuation.rate('usd', self.tickers), 1.0 / 101.0)
+
+	def test_value(self):
+		rates = self.valuation.rates(self.tickers)
+		self.assertEqual(set(rates), {'btc', 'ltc', 'nmc', 'usd'})
+		values, total, complete = BTCe.Valuation.value({'btc' : 2, 'nmc' : 10, 'usd' : 5, 'xyz' : 0}, rates)
+		self.assertEqual(values, {'btc' : 200.0, 'nmc' : 10.0, 'usd' : 5.0, 'xyz' : None})
+		self.assertAlmostEqual(total, 215.0)
+		self.assertTrue(complete)
+
+	def test_partial_value(self):
+		del self.tickers['nmc_btc']
+		values, total, complete = BTCe.Valuation.value({'btc' : 2, 'nmc' : 10}, self.valuation.rates(self.tickers))
+		self.assertIsNone(values['nmc'])
+		self.assertAlmostEqual(total, 200.0)
+		self.assertFalse(complete)
+
+	def test_missing_ticker(self):
+		del self.tickers['btc_usd']
+		self.assertAlmostEqual(self.valuation.rate('ltc', self.tickers), 9.0)
+		self.assertAlmostEqual(self.valuation.rate('nmc', self.tickers), 0.01 / 0.11 * 9.0)
+		del self.tickers['ltc_usd']
+		self.assertIsNone(self.valuation.rate('nmc', self.tickers))
+
+	def test_rebuild(self):
+		paths = self.valuation.paths
+		self.valuation.update(['ltc_btc', 'btc_usd', 'nmc_btc', 'ltc_usd'])
+		self.assertIs(self.valuation.paths, paths)
+		self.valuation.update(['btc_usd'])
+		self.assertEqual(self.valuation.tickerpairs, ['btc_usd'])
+
+	def test_maxhops(self):
+		valuation = BTCe.Valuation(maxhops=1)
+		valuation.update(['btc_usd', 'nmc_btc'])
+		self.assertNotIn('nmc', valuation.paths)
+
+class TriggersTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.dir.name, 'rules.json')
+		self.triggers = BTCe.Triggers(self.path)
+
+	def tearDown(self):
+		self.dir.cleanup()
+
+	def fired(self, bid, ask, pair = 'btc_usd'):
+		return [rule['id'] for rule in self.triggers.evaluate(pair, bid, ask)]
+
+	def test_sell_rules_watch_bid(self):
+		stop = self.triggers.add('btc_usd', 'Stop-loss', 'sell', 90.0, 1.0)['id']
+		take = self.triggers.add('btc_usd', 'Take-profit', 'sell', 110.0, 1.0)['id']
+		# the ask crossing the thresholds does not matter for sell rules
+		self.assertEqual(self.fired(100.0, 85.0), [])
+		self.assertEqual(self.fired(100.0, 120.0), [])
+		self.assertEqual(self.fired(90.5, 91.0), [])
+		self.assertEqual(self.fired(90.0, 91.0), [stop])
+		self.assertEqual(self.fired(111.0, 112.0), [take])
+		self.assertEqual(self.triggers.list(), [])
+
+	def test_buy_rules_watch_ask(self):
+		stop = self.triggers.add('btc_usd', 'Stop-loss', 'buy', 110.0, 1.0)['id']
+		take = self.triggers.add('btc_usd', 'Take-profit', 'buy', 90.0, 1.0)['id']
+		self.assertEqual(self.fired(120.0, 100.0), [])
+		self.assertEqual(self.fired(85.0, 100.0), [])
+		self.assertEqual(self.fired(109.0, 110.0), [stop])
+		self.assertEqual(self.fired(88.0, 89.0), [take])
+
+	def test_alerts(self):
+		above = self.triggers.add('btc_usd', 'Alert above', 'sell', 105.0)['id']
+		below = self.triggers.add('btc_usd', 'Alert below', 'buy', 95.0)['id']
+		self.assertEqual(self.fired(104.0, 96.0), [])
+		self.assertEqual(self.fired(105.0, 96.0), [above])
+		self.assertEqual(self.fired(100.0, 95.0), [below])
+
+	def test_pairs_and_order(self):
+		self.triggers.add('ltc_usd', 'Stop-loss', 'sell', 9.0, 1.0)
+		first = self.triggers.add('btc_usd', 'Stop-loss', 'sell', 95.0, 1.0)['id']
+		second = self.triggers.add('btc_usd', 'Stop-loss', 'sell', 90.0, 1.0)['id']
+		self.assertEqual(self.triggers.pairs(), {'btc_usd', 'ltc_usd'})
+		self.assertEqual(self.fired(92.0, 93.0), [first])
+		rules = self.triggers.evaluate('btc_usd', 80.0, 81.0)
+		self.assertEqual([rule['id'] for rule in rules], [second])
+		self.assertEqual(rules[0]['price'], 80.0)
+		self.assertEqual([rule['pair'] for rule in self.triggers.list()], ['ltc_usd'])
+
+	def test_remove(self):
+		id = self.triggers.add('btc_usd', 'Stop-loss', 'sell', 90.0, 1.0)['id']
+		self.triggers.remove(id)
+		self.assertEqual(self.fired(80.0, 81.0), [])
+
+	def test_rearm(self):
+		self.triggers.add('btc_usd', 'Stop-loss', 'sell', 90.0, 1.0)
+		rule = self.triggers.evaluate('btc_usd', 80.0, 81.0, 1000.0)[0]
+		self.assertTrue(self.triggers.rearm(rule, 1000.0))
+		# the rule stays armed but does not fire again until its backoff ran out
+		self.assertEqual(self.triggers.evaluate('btc_usd', 80.0, 81.0, 1004.0), [])
+		self.assertEqual(len(self.triggers.list()), 1)
+		rule = self.triggers.evaluate('btc_usd', 80.0, 81.0, 1005.0)[0]
+		self.assertEqual(rule['failures'], 1)
+		self.assertTrue(self.triggers.rearm(rule, 1005.0))
+		self.assertEqual(self.triggers.evaluate('btc_usd', 80.0, 81.0, 1014.0), [])
+		self.assertEqual([rule['id'] for rule in self.triggers.evaluate('btc_usd', 80.0, 81.0, 1015.0)], [rule['id']])
+
+	def test_rearm_limit(self):
+		self.triggers.add('btc_usd', 'Stop-loss', 'sell', 90.0, 1.0)
+		rule = self.triggers.evaluate('btc_usd', 80.0, 81.0)[0]
+		for i in range(BTCe.Triggers.retries):
+			self.assertTrue(self.triggers.rearm(rule, 0.0))
+			rule = self.triggers.evaluate('btc_usd', 80.0, 81.0)[0]
+		self.assertFalse(self.triggers.rearm(rule, 0.0))
+		self.assertEqual(self.triggers.list(), [])
+
+	def test_persistence(self):
+		stop = self.triggers.add('btc_usd', 'Stop-loss', 'sell', 90.0, 1.5, 89.0, 'Default')
+		take = self.triggers.add('btc_usd', 'Take-profit', 'buy', 80.0, 2.0)
+		fired = self.triggers.add('ltc_usd', 'Alert above', 'sell', 10.0)
+		self.triggers.evaluate('ltc_usd', 11.0, 12.0)
+
+		triggers = BTCe.Triggers(self.path)
+		self.assertEqual(triggers.list(), [stop, take])
+		self.assertEqual(triggers.add('btc_usd', 'Alert below', 'sell', 1.0)['id'], fired['id'] + 1)
+		self.assertEqual([rule['id'] for rule in triggers.evaluate('btc_usd', 95.0, 79.0)], [take['id']])
+
+	def test_corrupt_file(self):
+		with open(self.path, 'w') as file:
+			file.write('[{"id" : 1, "pair"')
+		triggers = BTCe.Triggers(self.path)
+		self.assertTrue(triggers.loaderror)
+		self.assertEqual(triggers.list(), [])
+		self.assertTrue(os.path.isfile(self.path + '.bad'))
+		triggers.add('btc_usd', 'Stop-loss', 'sell', 90.0, 1.0)
+		self.assertEqual(len(BTCe.Triggers(self.path).list()), 1)
+
+class BookTest(unittest.TestCase):
+	def test_apply(self):
+		book = BTCe.Book()
+		book.reset([[101.0, 1.0], [103.0, 3.0]], [[99.0, 1.0], [97.0, 3.0]], 5)
+		book.apply('asks', [[102.0, 2.0], [101.0, 0], [104.0, 0]])
+		book.apply('bids', [[98.0, 2.0], [97.0, 4.0]])
+		self.assertEqual(book.seq, 5)
+		self.assertEqual(book.depth(), {'asks' : [[102.0, 2.0], [103.0, 3.0]], 'bids' : [[99.0, 1.0], [98.0, 2.0], [97.0, 4.0]]})
+		self.assertEqual(book.depth(1), {'asks' : [[102.0, 2.0]], 'bids' : [[99.0, 1.0]]})
+
+class FakeWebSocket:
+	def __init__(self, feed = None, messages = ()):
+		self.feed = feed
+		self.messages = list(messages)
+		self.sent = []
+
+	def send(self, text):
+		self.sent.append(json.loads(text))
+
+	def recv(self):
+		if not self.messages:
+			self.feed.run = False
+			raise socket.timeout()
+		return self.messages.pop(0)
+
+class StreamFeedTest(unittest.TestCase):
+	def setUp(self):
+		self.feed = BTCe.StreamFeed('ws://localhost:8765/')
+		self.depths = []
+		self.errors = []
+		self.feed.listen(lambda pair, depth: self.depths.append(depth), onerror=self.errors.append)
+		self.ws = FakeWebSocket()
+		self.book = BTCe.Book()
+
+	def handle(self, message):
+		self.feed.handle(self.ws, 'btc_usd', self.book, dict(message, pair='btc_usd'))
+
+	def test_diffs_and_gap(self):
+		self.handle({'type' : 'snapshot', 'seq' : 1, 'asks' : [[101.0, 1.0]], 'bids' : [[99.0, 1.0]]})
+		self.handle({'type' : 'depth', 'seq' : 2, 'asks' : [[100.5, 2.0]], 'bids' : []})
+		self.assertEqual(self.depths[-1]['asks'][0], [100.5, 2.0])
+		self.handle({'type' : 'depth', 'seq' : 4, 'asks' : [[100.0, 2.0]], 'bids' : []})
+		self.assertIsNone(self.book.seq)
+		self.assertEqual(self.ws.sent, [{'op' : 'snapshot', 'pair' : 'btc_usd'}])
+		# diffs are ignored until the snapshot arrives
+		self.handle({'type' : 'depth', 'seq' : 5, 'asks' : [[100.0, 2.0]], 'bids' : []})
+		self.assertEqual(len(self.depths), 2)
+		self.assertEqual(len(self.ws.sent), 1)
+
+	def test_lost_snapshot(self):
+		self.feed.maxdropped = 3
+		self.handle({'type' : 'snapshot', 'seq' : 1, 'asks' : [[101.0, 1.0]], 'bids' : [[99.0, 1.0]]})
+		self.handle({'type' : 'depth', 'seq' : 3, 'asks' : [], 'bids' : []})
+		self.assertEqual(len(self.ws.sent), 1)
+		# the snapshot is requested again after maxdropped diffs
+		for seq in range(4, 7):
+			self.handle({'type' : 'depth', 'seq' : seq, 'asks' : [], 'bids' : []})
+		self.assertEqual(self.ws.sent, [{'op' : 'snapshot', 'pair' : 'btc_usd'}] * 2)
+		# or once it is overdue
+		self.feed.requested -= self.feed.timeout
+		self.handle({'type' : 'depth', 'seq' : 7, 'asks' : [], 'bids' : []})
+		self.assertEqual(len(self.ws.sent), 3)
+		self.handle({'type' : 'snapshot', 'seq' : 7, 'asks' : [[102.0, 1.0]], 'bids' : [[99.0, 1.0]]})
+		self.handle({'type' : 'depth', 'seq' : 8, 'asks' : [[101.5, 1.0]], 'bids' : []})
+		self.assertEqual(self.depths[-1]['asks'][0], [101.5, 1.0])
+
+	def test_callback_errors(self):
+		def fail(pair, depth):
+			raise RuntimeError('callback failed')
+		self.feed.listen(fail, onerror=self.errors.append)
+		self.handle({'type' : 'snapshot', 'seq' : 1, 'asks' : [[101.0, 1.0]], 'bids' : [[99.0, 1.0]]})
+		self.assertEqual(self.book.seq, 1)
+		self.assertEqual(len(self.errors), 1)
+
+	def test_malformed_messages(self):
+		messages = [
+			{'type' : 'snapshot', 'seq' : 1, 'asks' : [[101.0, 1.0]], 'bids' : [[99.0, 1.0]]},
+			{'type' : 'depth', 'asks' : []},
+			{'type' : 'snapshot', 'seq' : 3, 'asks' : [[101.0, 1.0]], 'bids' : [[99.0, 1.0]]},
+			{'type' : 'depth', 'seq' : 4, 'asks' : [['x', 1.0]]},
+			{'type' : 'snapshot', 'seq' : 5, 'asks' : [[102.0, 1.0]], 'bids' : [[99.0, 1.0]]},
+		]
+		ws = FakeWebSocket(self.feed, [json.dumps(dict(message, pair='btc_usd')) for message in messages] + ['not json'])
+		self.feed.subscribe('btc_usd')
+		self.feed.run = True
+		self.feed.stream(ws)
+		self.assertEqual(ws.sent, [{'op' : 'subscribe', 'pair' : 'btc_usd'}] + [{'op' : 'snapshot', 'pair' : 'btc_usd'}] * 3)
+		self.assertEqual(len(self.errors), 3)
+		self.assertEqual(self.depths[-1]['asks'], [[102.0, 1.0]])
+
+class HistoryTest(unittest.TestCase):
+	def record(self, history, now, ask = 101.0, bid = 100.0, askamount = 1.0, bidamount = 3.0):
+		return history.record({'asks' : [[ask, askamount]], 'bids' : [[bid, bidamount]]}, now)
+
+	def test_metrics(self):
+		history = BTCe.History(capacity=10)
+		self.assertFalse(history.record({'asks' : [], 'bids' : [[100.0, 1.0]]}, 0.0))
+		self.assertTrue(self.record(history, 0.0))
+		self.assertEqual(history.last('spread'), 1.0)
+		self.assertEqual(history.last('mid'), 100.5)
+		self.assertEqual(history.last('imbalance'), 0.5)
+
+	def test_faster_than_resolution(self):
+		history = BTCe.History(capacity=1000, resolution=1.0)
+		for i in range(100):
+			self.record(history, 1000.0 + 0.5 * i, ask=101.0 + i)
+		# two samples per second share a bucket, the later one wins
+		self.assertEqual(history.count, 50)
+		self.assertEqual(history.total, 100)
+		times, values = history.window('spread', 100.0, 1050.0)
+		self.assertEqual(len(values), 50)
+		self.assertEqual(values[:2], [2.0, 4.0])
+		self.assertEqual(history.last('spread'), 100.0)
+
+	def test_ring_buffer(self):
+		history = BTCe.History(capacity=10, resolution=1.0)
+		for i in range(25):
+			self.record(history, float(i), ask=101.0 + i)
+		self.assertEqual(history.count, 10)
+		times, values = history.window('spread', 1000.0, 25.0)
+		self.assertEqual(times, [float(i) for i in range(15, 25)])
+		self.assertEqual(history.window('spread', 3.0, 25.0)[0], [22.0, 23.0, 24.0])
+		self.assertEqual(history.stats('spread', 3.0, 25.0), (23.0, 25.0, 24.0))
+		self.assertIsNone(history.stats('spread', 3.0, 100.0))
+
+	def test_downsample(self):
+		history = BTCe.History(capacity=100, resolution=1.0)
+		for i in range(10):
+			self.record(history, float(i), ask=101.0 + i)
+		self.assertEqual(history.downsample('spread', 5, 20.0, 20.0), [2.5, 6.5, 9.5, None, None])
+		self.assertEqual(history.downsample('spread', 2, 10.0, 10.0), [3.0, 8.0])
+
+if __name__ == '__main__':
+	unittest.main()